@@ -27,5 +27,8 @@ def register_pipelines() -> dict[str, Pipeline]:
         "data_preprocessing": data_preprocessing_pipeline.create_pipeline(),
         "feature_engineering": feature_engineering_pipeline.create_pipeline(),
         "mixed_modeling": mixed_modeling_pipeline.create_pipeline(),
+        "mixed_modeling_selection": mixed_modeling_pipeline.create_model_selection_pipeline(),
+        "mixed_modeling_sufficient_stats": mixed_modeling_pipeline.create_sufficient_stats_pipeline(),
+        "mixed_modeling_distributed": mixed_modeling_pipeline.create_distributed_pipeline(),
         "__default__": data_ingestion_pipeline.create_pipeline() + data_preprocessing_pipeline.create_pipeline() + feature_engineering_pipeline.create_pipeline() + mixed_modeling_pipeline.create_pipeline()
     }
\ No newline at end of file
@@ -12,7 +12,37 @@ def _loess_fallback(values: np.ndarray, frac: float) -> np.ndarray:
     series = pd.Series(values)
     return series.rolling(window=span, min_periods=1, center=True).mean().to_numpy()
 
-def feature_engineering_node(rolled_up_beverage_data: pd.DataFrame, holiday_calendar: pd.DataFrame, params: dict) -> pd.DataFrame:
+def _price_indices(df: pd.DataFrame, product_master_data: pd.DataFrame) -> pd.DataFrame:
+    """Own price relative to competing PPGs in the same retailer-week.
+
+    ``cpi`` compares against the other PPGs of the same brand, ``xpi`` against
+    PPGs of other brands and ``opi`` against all other PPGs, each as a
+    leave-one-out volume-weighted price. These are differences of group totals,
+    e.g. ``(brand_sales - own_sales) / (brand_volume - own_volume)``, so the cost
+    is linear in rows. Indices without any competitor are neutral (1.0).
+    """
+    brands = product_master_data.drop_duplicates('ppg_id').set_index('ppg_id')['brand']
+    brand = df['ppg_id'].map(brands)
+    if 'brand' in df:
+        brand = brand.fillna(df['brand'])
+
+    market = [df['retailer_id'], df['week_id']]
+    market_sales = df.groupby(market)['total_sales'].transform('sum')
+    market_volume = df.groupby(market)['total_volume'].transform('sum')
+    brand_sales = df.groupby(market + [brand], dropna=False)['total_sales'].transform('sum')
+    brand_volume = df.groupby(market + [brand], dropna=False)['total_volume'].transform('sum')
+
+    def relative_to(sales: pd.Series, volume: pd.Series) -> pd.Series:
+        competitor_price = sales / volume.where(volume > 0)
+        return (df['avg_price'] / competitor_price).fillna(1.0)
+
+    return pd.DataFrame({
+        'cpi': relative_to(brand_sales - df['total_sales'], brand_volume - df['total_volume']),
+        'xpi': relative_to(market_sales - brand_sales, market_volume - brand_volume),
+        'opi': relative_to(market_sales - df['total_sales'], market_volume - df['total_volume']),
+    }, index=df.index)
+
+def feature_engineering_node(rolled_up_beverage_data: pd.DataFrame, holiday_calendar: pd.DataFrame, product_master_data: pd.DataFrame, params: dict) -> pd.DataFrame:
     """
     Applies feature engineering to rolled-up beverage data.
     """
@@ -28,10 +58,8 @@ def feature_engineering_node(rolled_up_beverage_data: pd.DataFrame, holiday_cale
     # 3️⃣ Merge with holiday calendar on week_id
     df = pd.merge(df, holiday_calendar, on='week_id', how='left')
 
-    # 4️⃣ Calculate CPI, XPI, and OPI (dummy values, placeholder for now)
-    df['cpi'] = np.random.uniform(1.0, 1.5, len(df))
-    df['xpi'] = np.random.uniform(0.8, 1.2, len(df))
-    df['opi'] = np.random.uniform(0.9, 1.1, len(df))
+    # 4️⃣ Calculate CPI (within brand), XPI (across brands) and OPI (all competitors)
+    df[['cpi', 'xpi', 'opi']] = _price_indices(df, product_master_data)
 
     # 5️⃣ Log transformations
     df['log_total_volume'] = np.log1p(df['total_volume'])
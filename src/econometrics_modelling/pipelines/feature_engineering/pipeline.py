@@ -5,8 +5,8 @@ def create_pipeline(**kwargs):
     return Pipeline([
         node(
             feature_engineering_node,
-            inputs=["rolled_up_beverage_data", "holiday_calendar", "params:feature_engineering"],
-            outputs="feature_engineered_data",
+            inputs=["rolled_up_beverage_data", "holiday_calendar", "product_master_data", "params:feature_engineering"],
+            outputs="feature_engineered_data@pandas",
             name="feature_engineering_node"
         )
     ])
\ No newline at end of file
@@ -0,0 +1,220 @@
+import logging
+import time
+import warnings
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+COEFFICIENT_COLUMNS = ["term", "estimate", "stderr", "z_value", "p_value"]
+
+# Optimizers tried in order; gradient methods fail near zero variances, where
+# the derivative-free ones still reach the boundary optimum.
+FIT_METHODS = ("lbfgs", "powell", "nm")
+
+# Variances of a random effect are only identified with at least two levels.
+MIN_GROUP_LEVELS = 2
+
+
+def _split_top_level(expr: str, sep: str = "+") -> list[str]:
+    """Split ``expr`` on ``sep`` ignoring separators nested in parentheses."""
+
+    parts: list[str] = []
+    depth = 0
+    current = ""
+    for char in expr:
+        if char == "(":
+            depth += 1
+        elif char == ")":
+            depth -= 1
+        if char == sep and depth == 0:
+            parts.append(current.strip())
+            current = ""
+        else:
+            current += char
+    if current.strip():
+        parts.append(current.strip())
+    return parts
+
+
+def split_mixed_formula(formula: str) -> tuple[str, list[tuple[list[str], str]]]:
+    """Split an lme4-style formula into a fixed formula and random terms.
+
+    ``"y ~ x + (1+x|g)"`` becomes ``("y ~ x", [(["1", "x"], "g")])``. A random
+    term without an explicit ``0`` or ``1`` carries an implicit intercept, as in
+    ``MixedModels.jl``.
+    """
+
+    target, rhs = (side.strip() for side in formula.split("~", 1))
+    fixed_terms: list[str] = []
+    random_terms: list[tuple[list[str], str]] = []
+    for term in _split_top_level(rhs):
+        if term.startswith("(") and term.endswith(")") and "|" in term:
+            effects, group = term[1:-1].split("|", 1)
+            parts = _split_top_level(effects)
+            if "0" not in parts and "1" not in parts:
+                parts = ["1", *parts]
+            random_terms.append((parts, group.strip()))
+        else:
+            fixed_terms.append(term)
+    fixed = " + ".join(fixed_terms) or "1"
+    return f"{target} ~ {fixed}", random_terms
+
+
+def _random_structure(
+    random_terms: list[tuple[list[str], str]],
+) -> tuple[Optional[str], str, dict[str, str], Optional[str]]:
+    """Translate random terms into ``MixedLM`` arguments.
+
+    Returns ``(groups, re_formula, vc_formula, warning)``. When every term
+    uses the same grouping factor it becomes ``groups``; the first term with
+    several effects goes into ``re_formula`` so their correlation is estimated
+    and the remaining effects become independent variance components within
+    each group. Crossed factors are expressed, as ``MixedLM`` requires, as
+    independent variance components over one constant group, in which case
+    correlations cannot be estimated and ``warning`` says so.
+    """
+
+    factors = {group for _, group in random_terms}
+    correlated = [
+        (parts, group)
+        for parts, group in random_terms
+        if len([part for part in parts if part != "0"]) > 1
+    ]
+
+    def effect_formula(part: str) -> str:
+        return "1" if part == "1" else f"0 + {part}"
+
+    if len(factors) == 1:
+        (group,) = factors
+        re_parts: list[str] = []
+        if correlated:
+            re_parts = correlated[0][0]
+        elif any(parts == ["1"] for parts, _ in random_terms):
+            re_parts = ["1"]
+        # Parsed parts always start with an explicit "0" or "1".
+        re_formula = " + ".join(re_parts) or "0"
+        vc_formula = {
+            f"{part}|{group}": effect_formula(part)
+            for parts, _ in random_terms
+            for part in parts
+            if part != "0" and part not in re_parts
+        }
+        warning = None
+        if len(correlated) > 1:
+            warning = f"only the correlation within {correlated[0][0]} is estimated"
+        return group, re_formula, vc_formula, warning
+
+    vc_formula = {}
+    for parts, group in random_terms:
+        for part in parts:
+            if part == "1":
+                vc_formula[f"1|{group}"] = f"0 + C({group})"
+            elif part != "0":
+                vc_formula[f"{part}|{group}"] = f"0 + C({group}):{part}"
+    warning = None
+    if correlated:
+        terms = ", ".join(
+            f"({'+'.join(parts)}|{group})" for parts, group in correlated
+        )
+        warning = (
+            f"correlations in {terms} not estimated: crossed random effects are "
+            "fitted as independent variance components"
+        )
+    return None, "0", vc_formula, warning
+
+
+def fit_mixedlm(data: pd.DataFrame, formula: str) -> dict:
+    """Fit ``formula`` in process with ``statsmodels.MixedLM``.
+
+    Models without random terms are fitted by OLS. Mixed models are always
+    fitted by maximum likelihood: REML likelihoods are not comparable across
+    fixed effects or with the OLS fit, and give no information criteria. Each method in ``FIT_METHODS`` is tried in
+    turn until one converges to a likelihood at least as high as the fixed
+    effects alone, which is always attainable with zero variances; otherwise
+    the best attempt is returned with ``converged=False``. Random effects on
+    factors with a single level in ``data`` are dropped with a ``warning``.
+
+    Returns:
+        A dictionary with ``aic``, ``bic``, ``log_likelihood``, ``fit_time``,
+        ``converged``, ``warning`` and a ``coefficients`` frame in the layout
+        of ``mixed_modeling_node``.
+    """
+
+    import statsmodels.formula.api as smf
+
+    fixed_formula, random_terms = split_mixed_formula(formula)
+    warnings_found: list[str] = []
+    single = sorted(
+        {
+            group
+            for _, group in random_terms
+            if data[group].nunique() < MIN_GROUP_LEVELS
+        }
+    )
+    if single:
+        random_terms = [term for term in random_terms if term[1] not in single]
+        warnings_found.append(
+            f"random effects on single-level factors {single} dropped"
+        )
+
+    start = time.perf_counter()
+    ols = smf.ols(fixed_formula, data).fit()
+    result, converged = ols, True
+    stats = (ols.params.index, ols.bse, ols.tvalues, ols.pvalues)
+    if random_terms:
+        groups, re_formula, vc_formula, warning = _random_structure(random_terms)
+        if warning:
+            warnings_found.append(warning)
+        model = smf.mixedlm(
+            fixed_formula,
+            data,
+            groups=data[groups] if groups else np.zeros(len(data), dtype=int),
+            re_formula=re_formula,
+            vc_formula=vc_formula or None,
+        )
+        floor = ols.llf - 1e-6 * abs(ols.llf)
+        best = None
+        for method in FIT_METHODS:
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore")
+                try:
+                    attempt = model.fit(reml=False, method=[method])
+                except (np.linalg.LinAlgError, ValueError) as exc:
+                    logger.debug("MixedLM %s failed for %s: %s", method, formula, exc)
+                    continue
+            if not np.isfinite(attempt.llf):
+                continue
+            if best is None or attempt.llf > best.llf:
+                best = attempt
+            if attempt.converged and attempt.llf >= floor:
+                break
+        if best is None:
+            raise RuntimeError(f"MixedLM failed with every method for {formula}")
+        result = best
+        converged = bool(best.converged and best.llf >= floor)
+        stats = (best.fe_params.index, best.bse_fe, best.tvalues, best.pvalues)
+    fit_time = time.perf_counter() - start
+
+    terms, stderr, z_value, p_value = stats
+    coefficients = pd.DataFrame(
+        {
+            "term": list(terms),
+            "estimate": result.params.reindex(terms).to_numpy(),
+            "stderr": stderr.reindex(terms).to_numpy(),
+            "z_value": z_value.reindex(terms).to_numpy(),
+            "p_value": p_value.reindex(terms).to_numpy(),
+        },
+        columns=COEFFICIENT_COLUMNS,
+    )
+    return {
+        "aic": float(result.aic),
+        "bic": float(result.bic),
+        "log_likelihood": float(result.llf),
+        "fit_time": fit_time,
+        "converged": converged,
+        "warning": "; ".join(warnings_found) or None,
+        "coefficients": coefficients,
+    }
@@ -1,9 +1,22 @@
+import hashlib
+import json
 import logging
+import re
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
 from pathlib import Path
 
 import pandas as pd
 
+from .backends import COEFFICIENT_COLUMNS, fit_mixedlm
+from .sufficient_stats import (
+    accumulate_sufficient_stats,
+    check_shrinkage,
+    solve_sufficient_stats,
+    stats_layout,
+)
+
 logger = logging.getLogger(__name__)
 
 
@@ -126,3 +139,374 @@ def mixed_modeling_node(feature_engineered_data: pd.DataFrame, params: dict):
         columns=["term", "estimate", "stderr", "z_value", "p_value"]
     )
     return fixed_dt
+
+
+# Spark SQL types of the per-segment coefficient table, after the segment keys
+# which are always strings.
+SEGMENT_SCHEMA = {
+    "term": "string",
+    "estimate": "double",
+    "stderr": "double",
+    "z_value": "double",
+    "p_value": "double",
+    "n_obs": "bigint",
+    "converged": "boolean",
+    "warning": "string",
+    "error": "string",
+}
+SEGMENT_COLUMNS = list(SEGMENT_SCHEMA)
+
+
+def _segment_schema(segment_levels: list) -> str:
+    """DDL schema of the ``applyInPandas`` output for ``segment_levels``."""
+
+    columns = {**{lvl: "string" for lvl in segment_levels}, **SEGMENT_SCHEMA}
+    return ", ".join(f"`{name}` {dtype}" for name, dtype in columns.items())
+
+
+def _segment_specification(params: dict, segment_levels: list) -> dict:
+    """Drop interactions and random effects on levels constant within a segment."""
+
+    spec = params.get("model_specification", {})
+    fixed = spec.get("fixed_effects", {})
+    random = spec.get("random_effects", {})
+    uncorrelated = random.get("uncorrelated", {})
+    return {
+        **params,
+        "model_specification": {
+            **spec,
+            "fixed_effects": {
+                **fixed,
+                "interactions": [
+                    i for i in fixed.get("interactions", [])
+                    if i["with_level"] not in segment_levels
+                ],
+            },
+            "random_effects": {
+                "uncorrelated": {
+                    "intercepts": [
+                        lvl for lvl in uncorrelated.get("intercepts", [])
+                        if lvl not in segment_levels
+                    ],
+                    "slopes": [
+                        s for s in uncorrelated.get("slopes", [])
+                        if s["by_level"] not in segment_levels
+                    ],
+                },
+                "correlated": [
+                    c for c in random.get("correlated", [])
+                    if c["by_level"] not in segment_levels
+                ],
+            },
+        },
+    }
+
+
+def _fit_segment(
+    segment: pd.DataFrame, segment_levels: list, formula: str
+) -> pd.DataFrame:
+    """Fit one segment, returning a single error row instead of raising.
+
+    Columns are typed to match ``_segment_schema`` so that all-null error rows
+    still convert through Arrow.
+    """
+
+    keys = {lvl: str(segment[lvl].iloc[0]) for lvl in segment_levels}
+    try:
+        fit = fit_mixedlm(segment, formula)
+        coefficients = fit["coefficients"].assign(
+            converged=fit["converged"], warning=fit["warning"], error=None
+        )
+    except Exception as exc:  # noqa: BLE001 - isolate failures per segment
+        coefficients = pd.DataFrame(
+            {
+                **{col: [None] for col in COEFFICIENT_COLUMNS},
+                "converged": [False],
+                "warning": [None],
+                "error": [f"{type(exc).__name__}: {exc}"],
+            }
+        )
+    coefficients["n_obs"] = len(segment)
+    coefficients = coefficients.assign(**keys)[[*segment_levels, *SEGMENT_COLUMNS]]
+    return coefficients.astype(
+        {
+            "term": object,
+            "estimate": float,
+            "stderr": float,
+            "z_value": float,
+            "p_value": float,
+            "n_obs": "int64",
+            "converged": bool,
+            "warning": object,
+            "error": object,
+        }
+    )
+
+
+def distributed_mixed_modeling_node(feature_engineered_data, params: dict):
+    """Fit ``model_specification`` per segment on Spark with ``applyInPandas``.
+
+    ``feature_engineered_data`` is a Spark DataFrame grouped by
+    ``params["distributed"]["segment_levels"]``, a subset of
+    ``hierarchy_levels``. Each group is fitted in process with ``fit_mixedlm``;
+    terms on the segment levels themselves are dropped from the formula.
+    Returns a Spark DataFrame of coefficients keyed by segment. Failed segments
+    keep a row with ``error`` set and are logged.
+    """
+
+    from pyspark.sql import functions as F
+
+    segment_levels = list(params.get("distributed", {}).get("segment_levels", []))
+    unknown = set(segment_levels) - set(params.get("hierarchy_levels", []))
+    if not segment_levels or unknown:
+        raise ValueError(
+            f"segment_levels must be a non-empty subset of hierarchy_levels, got "
+            f"{segment_levels}"
+        )
+
+    formula = prepare_formula_for_MM(_segment_specification(params, segment_levels))
+    logger.info("Segment model formula: %s", formula)
+
+    used = set(re.findall(r"[A-Za-z_]\w*", formula))
+    model_columns = [
+        col for col in feature_engineered_data.columns
+        if col in used and col not in segment_levels
+    ]
+    data = feature_engineered_data.select(
+        *[F.col(lvl).cast("string") for lvl in segment_levels], *model_columns
+    )
+
+    coefficients = (
+        data.groupBy(*segment_levels)
+        .applyInPandas(
+            partial(_fit_segment, segment_levels=segment_levels, formula=formula),
+            schema=_segment_schema(segment_levels),
+        )
+        .cache()
+    )
+
+    failed = (
+        coefficients.filter(F.col("error").isNotNull())
+        .select(*segment_levels, "error")
+        .collect()
+    )
+    n_segments = coefficients.select(*segment_levels).distinct().count()
+    logger.info("Fitted %d segments, %d failed", n_segments, len(failed))
+    for row in failed:
+        logger.warning(
+            "Segment %s failed: %s",
+            {lvl: row[lvl] for lvl in segment_levels},
+            row["error"],
+        )
+    return coefficients
+
+
+def sufficient_stats_node(
+    feature_engineered_chunks: Iterable[pd.DataFrame], params: dict, fast_params: dict
+) -> pd.DataFrame:
+    """Fit the fixed-effects part of ``model_specification`` from cross-products.
+
+    ``feature_engineered_chunks`` is an iterable of frames, e.g. a CSV dataset
+    loaded with ``chunksize``; a single frame is also accepted. Chunks are
+    reduced to ``X'X``, ``X'y`` and ``y'y`` blocks per group on ``n_workers``
+    processes, then solved by Cholesky. Random effects in the specification
+    are ignored except for the optional one-way ``random_intercept``
+    shrinkage.
+    """
+
+    spec = params.get("model_specification", {})
+    target = spec.get("dependent_variable", "y")
+    shrinkage = fast_params.get("shrinkage", "none")
+    level = fast_params.get("random_intercept_level")
+    check_shrinkage(shrinkage, level)
+    z_columns, group_keys = stats_layout(
+        spec, [level] if shrinkage == "random_intercept" else []
+    )
+
+    if isinstance(feature_engineered_chunks, pd.DataFrame):
+        feature_engineered_chunks = [feature_engineered_chunks]
+    columns = list(dict.fromkeys([target, *z_columns[1:], *group_keys]))
+    dummy_level = (params.get("hierarchy_levels") or [None])[-1]
+
+    def model_rows(chunks: Iterable[pd.DataFrame]) -> Iterable[pd.DataFrame]:
+        for chunk in chunks:
+            rows = chunk
+            if dummy_level in chunk:
+                rows = chunk[chunk[dummy_level] != "dummy"]
+            yield rows[columns]
+
+    stats = accumulate_sufficient_stats(
+        model_rows(feature_engineered_chunks),
+        target,
+        z_columns,
+        group_keys,
+        n_workers=int(fast_params.get("n_workers", 1)),
+    )
+    logger.info(
+        "Reduced %d rows to %d groups over %s",
+        stats["n"].sum(),
+        len(stats),
+        group_keys,
+    )
+    return solve_sufficient_stats(
+        stats,
+        spec,
+        z_columns,
+        group_keys,
+        shrinkage=shrinkage,
+        ridge_alpha=float(fast_params.get("ridge_alpha", 0.0)),
+        random_intercept_level=level,
+    )
+
+
+SELECTION_COLUMNS = [
+    "rank",
+    "spec_name",
+    "formula",
+    "aic",
+    "bic",
+    "log_likelihood",
+    "fit_time",
+    "converged",
+    "cached",
+    "warning",
+    "error",
+]
+
+# Whether a smaller value is better for each metric accepted as ``rank_by``.
+RANK_ASCENDING = {"aic": True, "bic": True, "log_likelihood": False}
+
+# Dataset shared by every task of a worker process, set once by the pool
+# initializer so the encoded frame is not pickled per specification.
+_SHARED_DATA = None
+
+
+def _init_selection_worker(data: pd.DataFrame) -> None:
+    global _SHARED_DATA  # noqa: PLW0603
+    _SHARED_DATA = data
+
+
+def _fit_selection_spec(name: str, formula: str) -> dict:
+    try:
+        fit = fit_mixedlm(_SHARED_DATA, formula)
+    except Exception as exc:  # noqa: BLE001 - one bad spec must not stop the grid
+        logger.warning("Specification %s failed: %s", name, exc)
+        return {"spec_name": name, "formula": formula, "error": str(exc)}
+    fit.pop("coefficients")
+    return {"spec_name": name, "formula": formula, "error": None, **fit}
+
+
+def _data_fingerprint(data: pd.DataFrame) -> str:
+    """Hash the content, columns and dtypes of ``data``."""
+
+    digest = hashlib.sha256()
+    digest.update(pd.util.hash_pandas_object(data, index=False).to_numpy().tobytes())
+    digest.update(json.dumps([[c, str(t)] for c, t in data.dtypes.items()]).encode())
+    return digest.hexdigest()
+
+
+def _cache_file(cache_path: Path, formula: str) -> Path:
+    return cache_path / f"{hashlib.sha256(formula.encode()).hexdigest()[:16]}.json"
+
+
+def _encode_for_selection(
+    data: pd.DataFrame, hierarchy_levels: Iterable[str]
+) -> pd.DataFrame:
+    """Drop dummy rows and encode hierarchy levels as categoricals once."""
+
+    df = data.copy()
+    levels = [lvl for lvl in hierarchy_levels if lvl in df.columns]
+    if levels:
+        df = df[df[levels[-1]] != "dummy"].reset_index(drop=True)
+    for lvl in levels:
+        df[lvl] = df[lvl].astype(str).astype("category")
+    return df
+
+
+def model_selection_node(
+    feature_engineered_data: pd.DataFrame, params: dict, selection_params: dict
+) -> pd.DataFrame:
+    """Fit a grid of model specification variants and rank them.
+
+    Each variant under ``selection_params["variants"]`` has a ``name`` and
+    either a ``formula`` or a ``model_specification`` whose keys override the
+    base ``params["model_specification"]``. Formulas are built with
+    ``prepare_formula_for_MM`` and fitted concurrently in a process pool that
+    receives the encoded dataset once per worker. Results are cached in
+    ``cache_dir`` keyed by data fingerprint and formula. Rows are ranked by
+    ``rank_by`` (``aic``, ``bic`` or ``log_likelihood``), with converged fits
+    ahead of unconverged ones.
+    """
+
+    n_workers = int(selection_params.get("n_workers", 1))
+    rank_by = selection_params.get("rank_by", "aic")
+    if rank_by not in RANK_ASCENDING:
+        raise ValueError(
+            f"rank_by must be one of {sorted(RANK_ASCENDING)}, got {rank_by!r}"
+        )
+    cache_dir = selection_params.get("cache_dir")
+
+    data = _encode_for_selection(
+        feature_engineered_data, params.get("hierarchy_levels", [])
+    )
+    fingerprint = _data_fingerprint(data)
+    cache_path = Path(cache_dir) / fingerprint[:16] if cache_dir else None
+
+    formulas: dict[str, str] = {}
+    for variant in selection_params.get("variants", []):
+        spec = {
+            **params.get("model_specification", {}),
+            **variant.get("model_specification", {}),
+        }
+        formulas[variant["name"]] = variant.get("formula") or prepare_formula_for_MM(
+            {"model_specification": spec}
+        )
+
+    rows: list[dict] = []
+    pending: dict[str, str] = {}
+    for name, formula in formulas.items():
+        cache_file = _cache_file(cache_path, formula) if cache_path else None
+        if cache_file is not None and cache_file.exists():
+            logger.info("Using cached fit for %s: %s", name, formula)
+            cached = json.loads(cache_file.read_text())
+            rows.append({**cached, "spec_name": name, "cached": True})
+        else:
+            pending[name] = formula
+
+    if pending:
+        logger.info("Fitting %d specifications on %d workers", len(pending), n_workers)
+        if n_workers > 1:
+            with ProcessPoolExecutor(
+                max_workers=n_workers,
+                initializer=_init_selection_worker,
+                initargs=(data,),
+            ) as pool:
+                futures = [
+                    pool.submit(_fit_selection_spec, name, formula)
+                    for name, formula in pending.items()
+                ]
+                fitted = [future.result() for future in futures]
+        else:
+            _init_selection_worker(data)
+            fitted = [
+                _fit_selection_spec(name, formula) for name, formula in pending.items()
+            ]
+
+        for result in fitted:
+            rows.append({**result, "cached": False})
+            if cache_path is not None and result["error"] is None:
+                cache_path.mkdir(parents=True, exist_ok=True)
+                _cache_file(cache_path, result["formula"]).write_text(
+                    json.dumps(result)
+                )
+
+    table = pd.DataFrame(rows, columns=SELECTION_COLUMNS[1:])
+    # Converged fits rank ahead of unconverged ones, failed fits come last.
+    table["converged"] = table["converged"].eq(True)
+    table = table.sort_values(
+        ["converged", rank_by],
+        ascending=[False, RANK_ASCENDING[rank_by]],
+        na_position="last",
+    ).reset_index(drop=True)
+    table.insert(0, "rank", range(1, len(table) + 1))
+    return table
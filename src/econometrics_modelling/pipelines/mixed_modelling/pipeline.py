@@ -1,12 +1,47 @@
 from kedro.pipeline import Pipeline, node
-from .nodes import mixed_modeling_node
+from .nodes import (
+    distributed_mixed_modeling_node,
+    mixed_modeling_node,
+    model_selection_node,
+    sufficient_stats_node,
+)
 
 def create_pipeline(**kwargs):
     return Pipeline([
         node(
             mixed_modeling_node,
-            inputs=["feature_engineered_data", "params:mixed_modeling"],
+            inputs=["feature_engineered_data@pandas", "params:mixed_modeling"],
             outputs="model_coefficients",
             name="mixed_modeling_node"
         )
+    ])
+
+def create_model_selection_pipeline(**kwargs):
+    return Pipeline([
+        node(
+            model_selection_node,
+            inputs=["feature_engineered_data@pandas", "params:mixed_modeling", "params:model_selection"],
+            outputs="model_selection_table",
+            name="model_selection_node"
+        )
+    ])
+
+def create_sufficient_stats_pipeline(**kwargs):
+    return Pipeline([
+        node(
+            sufficient_stats_node,
+            inputs=["feature_engineered_data@chunks", "params:mixed_modeling", "params:sufficient_stats"],
+            outputs="sufficient_stats_coefficients",
+            name="sufficient_stats_node"
+        )
+    ])
+
+def create_distributed_pipeline(**kwargs):
+    return Pipeline([
+        node(
+            distributed_mixed_modeling_node,
+            inputs=["feature_engineered_data@spark", "params:mixed_modeling"],
+            outputs="segment_model_coefficients",
+            name="distributed_mixed_modeling_node"
+        )
     ])
\ No newline at end of file
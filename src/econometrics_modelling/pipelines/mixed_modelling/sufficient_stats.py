@@ -0,0 +1,387 @@
+"""Fixed-effects fits from aggregated cross-products.
+
+Rows are reduced to ``n``, ``Z'Z``, ``Z'y`` and ``y'y`` per group key, where
+``Z`` holds the intercept and the measures of the specification. Interactions
+``measure:level`` only need ``level`` to be part of the group key: within a
+group the level indicators are constant, so the full design ``X`` is a column
+selection of ``Z`` and ``X'X`` is assembled group by group without ever
+materialising row-level ``X``.
+"""
+
+import logging
+from collections.abc import Iterable
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+from scipy import linalg
+from scipy import stats as st
+
+from .backends import COEFFICIENT_COLUMNS
+
+logger = logging.getLogger(__name__)
+
+# Smallest eigenvalue, relative to the largest, of the unit-diagonal normal
+# equations below which the design is treated as collinear.
+SINGULAR_TOLERANCE = 1e-10
+
+SHRINKAGE_METHODS = ("none", "ridge", "random_intercept")
+
+
+def stats_layout(spec: dict, group_keys: Iterable[str] = ()) -> tuple[list, list]:
+    """Return the ``Z`` columns and group keys needed for ``spec``.
+
+    ``spec`` is a ``model_specification`` mapping. Every ``with_level`` of an
+    interaction is added to ``group_keys``.
+    """
+
+    interactions = spec.get("fixed_effects", {}).get("interactions", [])
+    measures = list(spec.get("main_effects", []))
+    for interaction in interactions:
+        if interaction["measure"] not in measures:
+            measures.append(interaction["measure"])
+    keys = list(group_keys)
+    for interaction in interactions:
+        if interaction["with_level"] not in keys:
+            keys.append(interaction["with_level"])
+    return ["Intercept", *measures], keys
+
+
+def accumulate_chunk(
+    chunk: pd.DataFrame, target: str, z_columns: list, group_keys: list
+) -> pd.DataFrame:
+    """Reduce one chunk of rows to per-group cross-products.
+
+    Returns a frame indexed by ``group_keys`` (with their original values)
+    with columns ``n``, ``yy``, ``zy_i`` and ``zz_i_j`` (upper triangle,
+    ``i <= j``). Each entry is a ``bincount`` over group codes, so beyond the
+    chunk itself only one row-length vector is alive at a time. Rows with
+    missing values are dropped, as patsy does.
+    """
+
+    z = np.column_stack(
+        [np.ones(len(chunk))] + [chunk[col].to_numpy(float) for col in z_columns[1:]]
+    )
+    y = chunk[target].to_numpy(float)
+    complete = np.isfinite(z).all(axis=1) & np.isfinite(y)
+    if group_keys:
+        complete &= chunk[group_keys].notna().all(axis=1).to_numpy()
+    z, y = z[complete], y[complete]
+
+    key_values = [chunk[key].to_numpy()[complete] for key in group_keys]
+    if len(key_values) > 1:
+        codes, groups = pd.factorize(pd.MultiIndex.from_arrays(key_values))
+        groups.names = group_keys
+    else:
+        codes, uniques = pd.factorize(
+            key_values[0] if key_values else np.zeros(len(y), int)
+        )
+        groups = pd.Index(uniques, name=group_keys[0] if group_keys else None)
+    n_groups = len(groups)
+
+    def group_sum(values: np.ndarray) -> np.ndarray:
+        return np.bincount(codes, weights=values, minlength=n_groups)
+
+    q = len(z_columns)
+    products = {
+        "n": np.bincount(codes, minlength=n_groups).astype(float),
+        "yy": group_sum(y * y),
+    }
+    for i in range(q):
+        products[f"zy_{i}"] = group_sum(z[:, i] * y)
+    for i, j in zip(*np.triu_indices(q)):
+        products[f"zz_{i}_{j}"] = group_sum(z[:, i] * z[:, j])
+    return pd.DataFrame(products, index=groups)
+
+
+def merge_stats(parts: Iterable[pd.DataFrame]) -> pd.DataFrame:
+    """Sum per-group cross-products from several chunks or partitions."""
+
+    combined = pd.concat(list(parts))
+    levels = combined.index.nlevels
+    return combined.groupby(level=list(range(levels)) if levels > 1 else 0).sum()
+
+
+def accumulate_sufficient_stats(
+    chunks: Iterable[pd.DataFrame],
+    target: str,
+    z_columns: list,
+    group_keys: list,
+    n_workers: int = 1,
+) -> pd.DataFrame:
+    """Stream ``chunks`` into per-group cross-products in bounded memory.
+
+    ``chunks`` may be any iterable of frames, e.g. ``pd.read_csv(...,
+    chunksize=...)``. With ``n_workers > 1`` chunks are reduced in a process
+    pool with at most two chunks per worker in flight. Memory grows with the
+    chunk size and the number of groups, not the number of rows.
+
+    Raises:
+        ValueError: If ``chunks`` contain no complete row.
+    """
+
+    stats = None
+
+    def merge(part: pd.DataFrame) -> None:
+        nonlocal stats
+        stats = part if stats is None else merge_stats([stats, part])
+
+    if n_workers <= 1:
+        for chunk in chunks:
+            merge(accumulate_chunk(chunk, target, z_columns, group_keys))
+    else:
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            pending = set()
+            for chunk in chunks:
+                pending.add(
+                    pool.submit(accumulate_chunk, chunk, target, z_columns, group_keys)
+                )
+                if len(pending) >= 2 * n_workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        merge(future.result())
+            for future in pending:
+                merge(future.result())
+
+    if stats is None or stats["n"].sum() == 0:
+        raise ValueError(
+            f"No complete rows found for {target} ~ {z_columns[1:]} by {group_keys}"
+        )
+    return stats
+
+
+def _key_frame(stats: pd.DataFrame, group_keys: list) -> pd.DataFrame:
+    index = stats.index.to_frame(index=False)
+    if group_keys:
+        index.columns = group_keys
+    return index
+
+
+def _unpack(stats: pd.DataFrame, q: int) -> tuple[np.ndarray, np.ndarray]:
+    """Return ``Z'Z`` of shape ``(G, q, q)`` and ``Z'y`` of shape ``(G, q)``."""
+
+    zz = np.zeros((len(stats), q, q))
+    for i, j in zip(*np.triu_indices(q)):
+        zz[:, i, j] = zz[:, j, i] = stats[f"zz_{i}_{j}"].to_numpy()
+    zy = stats[[f"zy_{i}" for i in range(q)]].to_numpy()
+    return zz, zy
+
+
+def _design_terms(
+    spec: dict, z_columns: list, group_keys: list, stats: pd.DataFrame
+) -> tuple[list, list]:
+    """Name the columns of ``X`` and map them to ``Z`` columns and levels.
+
+    Columns follow patsy's order for ``prepare_formula_for_MM`` formulas:
+    terms are grouped by measure in order of first appearance, each main
+    effect before its interactions, and levels are sorted by their original
+    values like ``C(level)``. The first interaction of a measure without a
+    main effect is coded full-rank; every other interaction drops its first
+    level as the reference, as in patsy's coding of ``x + x:g`` and
+    ``x:g + x:h``.
+    """
+
+    main_effects = spec.get("main_effects", [])
+    interactions = spec.get("fixed_effects", {}).get("interactions", [])
+    index = _key_frame(stats, group_keys)
+    terms = ["Intercept"]
+    mapping = [(0, None, None)]
+    for position, measure in enumerate(z_columns[1:], start=1):
+        reduced = measure in main_effects
+        if reduced:
+            terms.append(measure)
+            mapping.append((position, None, None))
+        for interaction in interactions:
+            if interaction["measure"] != measure:
+                continue
+            level = interaction["with_level"]
+            values = sorted(index[level].unique())
+            for value in values[1:] if reduced else values:
+                terms.append(f"{measure}:{level}[{'T.' if reduced else ''}{value}]")
+                mapping.append((position, level, value))
+            reduced = True
+    return terms, mapping
+
+
+def _expand(
+    stats: pd.DataFrame, z_columns: list, group_keys: list, mapping: list
+) -> list[tuple]:
+    """Return ``(rows, X_g'X_g, X_g'y, n_g, y_g'y_g)`` per group.
+
+    ``rows`` are the columns of ``X`` active in the group; there
+    ``X_g = Z_g[:, cols]``.
+    """
+
+    zz, zy = _unpack(stats, len(z_columns))
+    n = stats["n"].to_numpy()
+    yy = stats["yy"].to_numpy()
+    index = _key_frame(stats, group_keys)
+    active = np.ones((len(stats), len(mapping)), dtype=bool)
+    for k, (_, level, value) in enumerate(mapping):
+        if level is not None:
+            active[:, k] = (index[level] == value).to_numpy()
+    z_index = np.array([col for col, _, _ in mapping])
+
+    blocks = []
+    for g in range(len(stats)):
+        rows = np.flatnonzero(active[g])
+        cols = z_index[rows]
+        blocks.append((rows, zz[g][np.ix_(cols, cols)], zy[g][cols], n[g], yy[g]))
+    return blocks
+
+
+def _assemble(blocks: list, p: int) -> tuple[np.ndarray, np.ndarray, float, float]:
+    xtx = np.zeros((p, p))
+    xty = np.zeros(p)
+    n = yty = 0.0
+    for rows, xx, xy, n_g, yy in blocks:
+        xtx[np.ix_(rows, rows)] += xx
+        xty[rows] += xy
+        n += n_g
+        yty += yy
+    return xtx, xty, n, yty
+
+
+def _group_by_level(
+    blocks: list, stats: pd.DataFrame, group_keys: list, level: str, p: int
+) -> list:
+    """Collapse group blocks to ``(n_r, X_r'1, X_r'y, 1'y)`` per ``level`` value."""
+
+    values = stats.index.get_level_values(group_keys.index(level)).astype(str)
+    collapsed: dict[str, list] = {}
+    for value, (rows, xx, xy, n_g, _) in zip(values, blocks):
+        entry = collapsed.setdefault(value, [0.0, np.zeros(p), np.zeros(p), 0.0])
+        entry[0] += n_g
+        # The intercept is X's first column, so its row of X'X holds X'1.
+        entry[1][rows] += xx[0]
+        entry[2][rows] += xy
+        entry[3] += xy[0]
+    return list(collapsed.values())
+
+
+def estimate_variance_components(
+    xtx: np.ndarray, xty: np.ndarray, n: float, yty: float, groups: list
+) -> tuple[float, float]:
+    """Moment estimates of the residual and random-intercept variances.
+
+    ``sigma2`` comes from the within-group regression, ``tau2`` from the
+    spread of group mean OLS residuals beyond ``sigma2 / n_r``.
+    """
+
+    w_xx = xtx.copy()
+    w_xy = xty.copy()
+    w_yy = yty
+    for n_r, x1, _, y1 in groups:
+        w_xx -= np.outer(x1, x1) / n_r
+        w_xy -= x1 * y1 / n_r
+        w_yy -= y1 * y1 / n_r
+    keep = np.diag(w_xx) > 1e-10 * max(1.0, np.diag(xtx).max())
+    beta_w = linalg.lstsq(w_xx[np.ix_(keep, keep)], w_xy[keep])[0]
+    rss_w = w_yy - beta_w @ w_xy[keep]
+    sigma2 = max(rss_w / max(n - len(groups) - keep.sum(), 1.0), 0.0)
+
+    beta = linalg.lstsq(xtx, xty)[0]
+    resid_means = np.array([(y1 - x1 @ beta) / n_r for n_r, x1, _, y1 in groups])
+    inv_sizes = np.array([1.0 / n_r for n_r, *_ in groups])
+    tau2 = max(np.mean(resid_means**2) - sigma2 * inv_sizes.mean(), 0.0)
+    return float(sigma2), float(tau2)
+
+
+def check_shrinkage(shrinkage: str, random_intercept_level: Optional[str]) -> None:
+    """Raise ``ValueError`` for an unknown or incomplete shrinkage setting."""
+
+    if shrinkage not in SHRINKAGE_METHODS:
+        raise ValueError(f"Unknown shrinkage: {shrinkage}")
+    if shrinkage == "random_intercept" and not random_intercept_level:
+        raise ValueError("shrinkage 'random_intercept' needs random_intercept_level")
+
+
+def _check_full_rank(lhs: np.ndarray, terms: list) -> None:
+    """Raise ``ValueError`` when the normal equations ``lhs`` are singular.
+
+    The check runs on ``lhs`` scaled to unit diagonal so that it does not
+    depend on the units of the measures.
+    """
+
+    diag = np.diag(lhs)
+    empty = [term for term, value in zip(terms, diag) if value <= 0]
+    if empty:
+        raise ValueError(f"Singular design: no variation in {empty}")
+    scale = 1.0 / np.sqrt(diag)
+    eigenvalues = np.linalg.eigvalsh(lhs * np.outer(scale, scale))
+    if eigenvalues[0] < SINGULAR_TOLERANCE * eigenvalues[-1]:
+        raise ValueError(
+            "Singular design: the columns of X are collinear (smallest scaled "
+            f"eigenvalue {eigenvalues[0]:.3g}); check overlapping interactions"
+        )
+
+
+def solve_sufficient_stats(  # noqa: PLR0913
+    stats: pd.DataFrame,
+    spec: dict,
+    z_columns: list,
+    group_keys: list,
+    shrinkage: str = "none",
+    ridge_alpha: float = 0.0,
+    random_intercept_level: Optional[str] = None,
+) -> pd.DataFrame:
+    """Solve the fixed-effects and interaction model by Cholesky.
+
+    ``shrinkage`` is ``"none"`` (exact OLS), ``"ridge"`` (``ridge_alpha``
+    added to every non-intercept diagonal) or ``"random_intercept"`` (GLS
+    with a one-way random intercept on ``random_intercept_level``, which must
+    be one of ``group_keys``).
+    """
+
+    check_shrinkage(shrinkage, random_intercept_level)
+    if shrinkage == "random_intercept" and random_intercept_level not in group_keys:
+        raise ValueError(
+            f"random_intercept_level {random_intercept_level} is not one of the "
+            f"group keys {group_keys}"
+        )
+
+    terms, mapping = _design_terms(spec, z_columns, group_keys, stats)
+    p = len(terms)
+    blocks = _expand(stats, z_columns, group_keys, mapping)
+    xtx, xty, n, yty = _assemble(blocks, p)
+
+    lhs, rhs = xtx.copy(), xty.copy()
+    if shrinkage == "ridge":
+        lhs[np.arange(1, p), np.arange(1, p)] += ridge_alpha
+    elif shrinkage == "random_intercept":
+        groups = _group_by_level(blocks, stats, group_keys, random_intercept_level, p)
+        sigma2, tau2 = estimate_variance_components(xtx, xty, n, yty, groups)
+        logger.info("Random intercept variances: sigma2=%.6g tau2=%.6g", sigma2, tau2)
+        # V_r^-1 = (I - w_r 11') / sigma2 with w_r = tau2 / (sigma2 + n_r tau2).
+        for n_r, x1, _, y1 in groups:
+            w_r = tau2 / (sigma2 + n_r * tau2) if sigma2 + n_r * tau2 > 0 else 0.0
+            lhs -= w_r * np.outer(x1, x1)
+            rhs -= w_r * x1 * y1
+
+    _check_full_rank(lhs, terms)
+    factor = linalg.cho_factor(lhs)
+    beta = linalg.cho_solve(factor, rhs)
+    cov = linalg.cho_solve(factor, np.eye(p))
+
+    if shrinkage == "random_intercept":
+        scale = sigma2
+    else:
+        rss = yty - 2 * beta @ xty + beta @ xtx @ beta
+        scale = rss / max(n - p, 1.0)
+        if shrinkage == "ridge":
+            cov = cov @ xtx @ cov
+    stderr = np.sqrt(np.clip(np.diag(cov) * scale, 0.0, None))
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_value = beta / stderr
+    return pd.DataFrame(
+        {
+            "term": terms,
+            "estimate": beta,
+            "stderr": stderr,
+            "z_value": z_value,
+            "p_value": 2 * st.norm.sf(np.abs(z_value)),
+        },
+        columns=COEFFICIENT_COLUMNS,
+    )
@@ -0,0 +1,65 @@
+"""Benchmark CPI/XPI/OPI against a pairwise implementation.
+
+Run with ``python tests/benchmark_price_indices.py``. The grouped version is
+timed on thousands of PPGs per retailer; the pairwise reference is only timed
+on the smallest size because its cost is quadratic in PPGs per retailer-week.
+"""
+import time
+
+import numpy as np
+import pandas as pd
+
+from econometrics_modelling.pipelines.feature_engineering.nodes import _price_indices
+
+
+def _panel(n_ppgs: int, n_retailers: int, n_weeks: int, n_brands: int = 50):
+    rng = np.random.default_rng(0)
+    index = pd.MultiIndex.from_product(
+        [range(n_ppgs), range(n_retailers), range(n_weeks)],
+        names=["ppg", "retailer", "week_id"],
+    ).to_frame(index=False)
+    df = pd.DataFrame({
+        "ppg_id": "PPG" + index["ppg"].astype(str),
+        "retailer_id": "R" + index["retailer"].astype(str),
+        "week_id": index["week_id"],
+    })
+    df["total_volume"] = rng.integers(1, 1000, len(df)).astype(float)
+    df["total_sales"] = df["total_volume"] * rng.uniform(0.5, 5.0, len(df))
+    df["avg_price"] = df["total_sales"] / df["total_volume"]
+    master = pd.DataFrame({
+        "ppg_id": "PPG" + pd.Series(range(n_ppgs)).astype(str),
+        "brand": "B" + (pd.Series(range(n_ppgs)) % n_brands).astype(str),
+    })
+    return df, master
+
+
+def _pairwise(df: pd.DataFrame) -> pd.Series:
+    """Quadratic reference for ``opi`` only: every PPG against every other."""
+    out = pd.Series(index=df.index, dtype=float)
+    for _, market in df.groupby(["retailer_id", "week_id"]):
+        sales = market["total_sales"].to_numpy()
+        volume = market["total_volume"].to_numpy()
+        others = ~np.eye(len(market), dtype=bool)
+        out[market.index] = market["avg_price"].to_numpy() / (
+            (others * sales).sum(axis=1) / (others * volume).sum(axis=1)
+        )
+    return out
+
+
+def main() -> None:
+    for n_ppgs in (1000, 2000, 4000, 8000):
+        df, master = _panel(n_ppgs, n_retailers=5, n_weeks=52)
+        start = time.perf_counter()
+        indices = _price_indices(df, master)
+        grouped = time.perf_counter() - start
+        line = f"{n_ppgs:>5} PPGs/retailer {len(df):>9} rows  grouped {grouped:7.3f}s"
+        if n_ppgs == 1000:  # noqa: PLR2004
+            start = time.perf_counter()
+            reference = _pairwise(df)
+            line += f"  pairwise {time.perf_counter() - start:7.3f}s"
+            np.testing.assert_allclose(indices["opi"], reference, rtol=1e-10)
+        print(line)  # noqa: T201
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+import numpy as np
+import pandas as pd
+
+from econometrics_modelling.pipelines.feature_engineering.nodes import (
+    _price_indices,
+    feature_engineering_node,
+)
+
+
+def _rolled_up(n_ppgs=6, n_retailers=2, n_weeks=3, seed=0):
+    rng = np.random.default_rng(seed)
+    rows = [
+        (f"PPG{p}", f"R{r}", w)
+        for p in range(n_ppgs)
+        for r in range(n_retailers)
+        for w in range(1, n_weeks + 1)
+    ]
+    df = pd.DataFrame(rows, columns=["ppg_id", "retailer_id", "week_id"])
+    df["total_volume"] = rng.integers(10, 100, len(df)).astype(float)
+    df["total_sales"] = df["total_volume"] * rng.uniform(1.0, 3.0, len(df))
+    df["avg_price"] = df["total_sales"] / df["total_volume"]
+    master = pd.DataFrame(
+        {
+            "ppg_id": [f"PPG{p}" for p in range(n_ppgs)],
+            "brand": [f"B{p % 3}" for p in range(n_ppgs)],
+        }
+    )
+    return df, master
+
+
+def _naive_indices(df, master):
+    brand = df["ppg_id"].map(master.set_index("ppg_id")["brand"])
+    out = []
+    for i in df.index:
+        same_market = (df["retailer_id"] == df.at[i, "retailer_id"]) & (
+            df["week_id"] == df.at[i, "week_id"]
+        )
+        others = same_market & (df.index != i)
+        indices = []
+        for mask in (
+            others & (brand == brand[i]),
+            others & (brand != brand[i]),
+            others,
+        ):
+            volume = df.loc[mask, "total_volume"].sum()
+            if volume == 0:
+                indices.append(1.0)
+            else:
+                price = df.loc[mask, "total_sales"].sum() / volume
+                indices.append(df.at[i, "avg_price"] / price)
+        out.append(indices)
+    return pd.DataFrame(out, columns=["cpi", "xpi", "opi"], index=df.index)
+
+
+def test_price_indices_match_pairwise():
+    df, master = _rolled_up()
+    pd.testing.assert_frame_equal(_price_indices(df, master), _naive_indices(df, master))
+
+
+def test_price_indices_neutral_without_competitors():
+    df, master = _rolled_up(n_ppgs=1, n_retailers=1, n_weeks=2)
+    indices = _price_indices(df, master)
+    assert (indices == 1.0).all().all()  # noqa: PLR2004
+
+
+def test_feature_engineering_node_is_deterministic():
+    df, master = _rolled_up()
+    df = df.drop(columns="avg_price")
+    for col in [
+        "promo_acv_tpr",
+        "promo_acv_feature",
+        "promo_acv_display",
+        "promo_acv_feature_display",
+    ]:
+        df[col] = 50.0
+    calendar = pd.DataFrame({"week_id": [1, 2, 3], "holiday_flag": [0, 1, 0]})
+    first = feature_engineering_node(df, calendar, master, {})
+    second = feature_engineering_node(df, calendar, master, {})
+    pd.testing.assert_frame_equal(first, second)
+    assert first[["cpi", "xpi", "opi"]].notna().all().all()
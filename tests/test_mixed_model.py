@@ -1,11 +1,44 @@
+import numpy as np
 import pandas as pd
+import pytest
 
+from econometrics_modelling.pipelines.mixed_modelling.backends import (
+    fit_mixedlm,
+    split_mixed_formula,
+)
 from econometrics_modelling.pipelines.mixed_modelling.nodes import (
+    _fit_segment,
+    _segment_schema,
+    _segment_specification,
+    distributed_mixed_modeling_node,
+    model_selection_node,
     prepare_data_for_MM,
     prepare_formula_for_MM,
+    sufficient_stats_node,
+)
+from econometrics_modelling.pipelines.mixed_modelling.sufficient_stats import (
+    accumulate_chunk,
+    accumulate_sufficient_stats,
+    estimate_variance_components,
+    solve_sufficient_stats,
+    stats_layout,
 )
 
 
+def _panel(n=300, seed=0):
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame(
+        {
+            "ppg_id": rng.choice(["P1", "P2", "P3", "P4"], n),
+            "retailer_id": rng.choice(["R1", "R2", "R3"], n),
+            "log_price": rng.normal(size=n),
+        }
+    )
+    offsets = df["ppg_id"].map({"P1": 0.0, "P2": 1.0, "P3": -1.0, "P4": 0.5})
+    df["log_vol"] = 1 - 2 * df["log_price"] + offsets + rng.normal(size=n)
+    return df
+
+
 def test_prepare_data_for_MM_adds_dummy():
     df = pd.DataFrame({"ppg": ["A"], "x": [1]})
     res = prepare_data_for_MM(df, ["ppg"], "ppg")
@@ -31,3 +64,437 @@ def test_prepare_formula_for_MM():
     assert "log_price" in formula
     assert "(1+log_price|ppg)" in formula
 
+
+
+def test_split_mixed_formula():
+    fixed, random = split_mixed_formula("y ~ x + x:g + (1|g) + (0+x|h) + (x|g)")
+    assert fixed == "y ~ x + x:g"
+    assert random == [(["1"], "g"), (["0", "x"], "h"), (["1", "x"], "g")]
+
+
+def _project_features():
+    from econometrics_modelling.pipelines.data_ingestion.nodes import (
+        generate_holiday_calendar,
+        generate_product_master_data,
+        generate_raw_beverage_data,
+    )
+    from econometrics_modelling.pipelines.data_preprocessing.nodes import (
+        data_rollup_node,
+    )
+    from econometrics_modelling.pipelines.feature_engineering.nodes import (
+        feature_engineering_node,
+    )
+
+    rolled_up = data_rollup_node(
+        generate_raw_beverage_data(), generate_product_master_data(), {}
+    )
+    return feature_engineering_node(
+        rolled_up, generate_holiday_calendar(), generate_product_master_data(), {}
+    )
+
+
+def test_fit_mixedlm_nested_likelihoods_do_not_decrease():
+    data = _project_features()
+    fixed = "log_total_volume ~ log_avg_price + log_promo_acv_tpr + trend"
+    nested = [
+        fixed,
+        f"{fixed} + (1|ppg_id)",
+        f"{fixed} + (1|ppg_id) + (1|retailer_id)",
+        f"{fixed} + (1|ppg_id) + (1|retailer_id) + (0+log_avg_price|ppg_id)",
+    ]
+    fits = [fit_mixedlm(data, formula) for formula in nested]
+    assert all(fit["converged"] for fit in fits)
+    for smaller, larger in zip(fits, fits[1:]):
+        tolerance = 1e-6 * abs(smaller["log_likelihood"])
+        assert larger["log_likelihood"] >= smaller["log_likelihood"] - tolerance
+
+
+def test_fit_mixedlm_estimates_single_factor_correlation():
+    rng = np.random.default_rng(1)
+    group = rng.integers(0, 30, 1500)
+    effects = rng.multivariate_normal([0, 0], [[1, 0.8], [0.8, 1]], 30)
+    x = rng.normal(size=1500)
+    y = 1 + 2 * x + effects[group, 0] + effects[group, 1] * x
+    data = pd.DataFrame(
+        {
+            "g": group.astype(str),
+            "h": rng.integers(0, 5, 1500).astype(str),
+            "x": x,
+            "y": y + 0.5 * rng.normal(size=1500),
+        }
+    )
+    uncorrelated = fit_mixedlm(data, "y ~ x + (1|g) + (0+x|g)")
+    correlated = fit_mixedlm(data, "y ~ x + (1+x|g)")
+    assert correlated["warning"] is None
+    assert correlated["log_likelihood"] > uncorrelated["log_likelihood"] + 1
+
+    crossed = fit_mixedlm(data, "y ~ x + (1+x|g) + (1|h)")
+    assert "not estimated" in crossed["warning"]
+
+
+def test_fit_mixedlm_drops_single_level_factors():
+    data = _panel().query("ppg_id == 'P1'")
+    fit = fit_mixedlm(data, "log_vol ~ log_price + (1+log_price|ppg_id)")
+    assert fit["converged"]
+    assert "ppg_id" in fit["warning"]
+    assert list(fit["coefficients"]["term"]) == ["Intercept", "log_price"]
+
+
+def test_model_selection_node_ranks_and_caches(tmp_path):
+    params = {
+        "hierarchy_levels": ["retailer_id", "ppg_id"],
+        "model_specification": {
+            "dependent_variable": "log_vol",
+            "main_effects": ["log_price"],
+            "random_effects": {"uncorrelated": {"intercepts": ["ppg_id"]}},
+        },
+    }
+    selection = {
+        "n_workers": 2,
+        "cache_dir": str(tmp_path),
+        "variants": [
+            {"name": "ppg_intercept"},
+            {"name": "fixed_only", "model_specification": {"random_effects": {}}},
+            {"name": "bad", "formula": "log_vol ~ missing_column"},
+        ],
+    }
+    table = model_selection_node(_panel(), params, selection)
+    assert list(table["spec_name"]) == ["ppg_intercept", "fixed_only", "bad"]
+    assert list(table["rank"]) == [1, 2, 3]
+    assert table["aic"].iloc[0] < table["aic"].iloc[1]
+    assert table["error"].iloc[2]
+    assert not table["cached"].any()
+
+    cached = model_selection_node(_panel(), params, {**selection, "n_workers": 1})
+    assert cached.set_index("spec_name")["cached"].to_dict() == {
+        "ppg_intercept": True,
+        "fixed_only": True,
+        "bad": False,
+    }
+    pd.testing.assert_series_equal(cached["aic"], table["aic"])
+
+
+def _fast_spec():
+    return {
+        "dependent_variable": "log_vol",
+        "main_effects": ["log_price"],
+        "fixed_effects": {
+            "interactions": [{"measure": "log_price", "with_level": "ppg_id"}]
+        },
+    }
+
+
+def test_sufficient_stats_match_full_ols(tmp_path):
+    import statsmodels.formula.api as smf
+
+    data = _panel()
+    data.to_csv(tmp_path / "features.csv", index=False)
+    coefs = sufficient_stats_node(
+        pd.read_csv(tmp_path / "features.csv", chunksize=37),
+        {"model_specification": _fast_spec()},
+        {"n_workers": 2},
+    )
+    full = smf.ols("log_vol ~ log_price + log_price:ppg_id", data).fit()
+    np.testing.assert_allclose(coefs["estimate"], full.params.to_numpy(), rtol=1e-8)
+    np.testing.assert_allclose(coefs["stderr"], full.bse.to_numpy(), rtol=1e-8)
+    assert list(coefs["term"]) == list(full.params.index)
+
+
+def test_sufficient_stats_follow_patsy_order_on_project_spec():
+    from pathlib import Path
+
+    import statsmodels.formula.api as smf
+    import yaml
+
+    config = Path("conf/base/parameters_mixed_modelling.yml").read_text()
+    params = yaml.safe_load(config)["mixed_modeling"]
+    data = _project_features()
+    coefs = sufficient_stats_node(data, params, {})
+    fixed_formula, _ = split_mixed_formula(prepare_formula_for_MM(params))
+    full = smf.ols(fixed_formula, data).fit()
+    assert list(coefs["term"]) == list(full.params.index)
+    np.testing.assert_allclose(coefs["estimate"], full.params.to_numpy(), rtol=1e-6)
+
+
+def test_sufficient_stats_sort_integer_levels_like_patsy():
+    import statsmodels.formula.api as smf
+
+    data = _panel()
+    data["store"] = data["retailer_id"].map({"R1": 10, "R2": 2, "R3": 1})
+    spec = {
+        "dependent_variable": "log_vol",
+        "main_effects": ["log_price"],
+        "fixed_effects": {
+            "interactions": [{"measure": "log_price", "with_level": "store"}]
+        },
+    }
+    coefs = sufficient_stats_node(data, {"model_specification": spec}, {})
+    assert list(coefs["term"]) == [
+        "Intercept",
+        "log_price",
+        "log_price:store[T.2]",
+        "log_price:store[T.10]",
+    ]
+    full = smf.ols("log_vol ~ log_price + log_price:C(store)", data).fit()
+    np.testing.assert_allclose(coefs["estimate"], full.params.to_numpy(), rtol=1e-8)
+
+
+def test_sufficient_stats_code_overlapping_interactions_like_patsy():
+    import statsmodels.formula.api as smf
+
+    data = _panel()
+    spec = {
+        "dependent_variable": "log_vol",
+        "main_effects": [],
+        "fixed_effects": {
+            "interactions": [
+                {"measure": "log_price", "with_level": "ppg_id"},
+                {"measure": "log_price", "with_level": "retailer_id"},
+            ]
+        },
+    }
+    coefs = sufficient_stats_node(data, {"model_specification": spec}, {})
+    full = smf.ols("log_vol ~ log_price:ppg_id + log_price:retailer_id", data).fit()
+    assert list(coefs["term"]) == list(full.params.index)
+    np.testing.assert_allclose(coefs["estimate"], full.params.to_numpy(), rtol=1e-8)
+    np.testing.assert_allclose(coefs["stderr"], full.bse.to_numpy(), rtol=1e-8)
+
+
+def test_sufficient_stats_reject_singular_design():
+    data = _panel()
+    data["region"] = data["retailer_id"]
+    spec = {
+        "dependent_variable": "log_vol",
+        "main_effects": ["log_price"],
+        "fixed_effects": {
+            "interactions": [
+                {"measure": "log_price", "with_level": "retailer_id"},
+                {"measure": "log_price", "with_level": "region"},
+            ]
+        },
+    }
+    with pytest.raises(ValueError, match="Singular design"):
+        sufficient_stats_node(data, {"model_specification": spec}, {})
+
+
+def test_sufficient_stats_streaming_equals_single_pass():
+    data = _panel()
+    z_columns, group_keys = stats_layout(_fast_spec(), ["retailer_id"])
+    chunks = (data.iloc[i : i + 47] for i in range(0, len(data), 47))
+    streamed = accumulate_sufficient_stats(chunks, "log_vol", z_columns, group_keys)
+    single = accumulate_chunk(data, "log_vol", z_columns, group_keys)
+    pd.testing.assert_frame_equal(streamed.sort_index(), single.sort_index())
+
+
+def test_sufficient_stats_reject_empty_input():
+    data = _panel()
+    z_columns, group_keys = stats_layout(_fast_spec(), ["retailer_id"])
+    with pytest.raises(ValueError, match="No complete rows"):
+        accumulate_sufficient_stats(iter([]), "log_vol", z_columns, group_keys)
+    data["log_vol"] = np.nan
+    with pytest.raises(ValueError, match="No complete rows"):
+        sufficient_stats_node(data, {"model_specification": _fast_spec()}, {})
+
+
+def test_sufficient_stats_shrinkage():
+    data = _panel()
+    spec = {"dependent_variable": "log_vol", "main_effects": ["log_price"]}
+    x = np.column_stack([np.ones(len(data)), data["log_price"]])
+    y = data["log_vol"].to_numpy()
+
+    ridge = sufficient_stats_node(
+        data,
+        {"model_specification": spec},
+        {"shrinkage": "ridge", "ridge_alpha": 10.0},
+    )
+    expected = np.linalg.solve(x.T @ x + np.diag([0.0, 10.0]), x.T @ y)
+    np.testing.assert_allclose(ridge["estimate"], expected, rtol=1e-10)
+
+    z_columns, group_keys = stats_layout(spec, ["ppg_id"])
+    stats = accumulate_chunk(data, "log_vol", z_columns, group_keys)
+    groups = [
+        (len(g), x[g.index].sum(axis=0), None, y[g.index].sum())
+        for _, g in data.groupby("ppg_id")
+    ]
+    sigma2, tau2 = estimate_variance_components(
+        x.T @ x, x.T @ y, len(y), y @ y, groups
+    )
+    assert 0.5 < sigma2 < 1.5  # noqa: PLR2004
+    assert tau2 > 0.1  # noqa: PLR2004
+
+    v = sigma2 * np.eye(len(y))
+    same = data["ppg_id"].to_numpy()[:, None] == data["ppg_id"].to_numpy()[None, :]
+    v += tau2 * same
+    v_inv = np.linalg.inv(v)
+    gls = np.linalg.solve(x.T @ v_inv @ x, x.T @ v_inv @ y)
+    shrunk = solve_sufficient_stats(
+        stats,
+        spec,
+        z_columns,
+        group_keys,
+        shrinkage="random_intercept",
+        random_intercept_level="ppg_id",
+    )
+    np.testing.assert_allclose(shrunk["estimate"], gls, rtol=1e-8)
+
+
+def test_sufficient_stats_validate_shrinkage_up_front():
+    def unreadable():
+        raise AssertionError("data read before validation")
+        yield
+
+    params = {"model_specification": _fast_spec()}
+    with pytest.raises(ValueError, match="needs random_intercept_level"):
+        sufficient_stats_node(unreadable(), params, {"shrinkage": "random_intercept"})
+    with pytest.raises(ValueError, match="Unknown shrinkage"):
+        sufficient_stats_node(unreadable(), params, {"shrinkage": "lasso"})
+
+
+def _segment_params():
+    return {
+        "hierarchy_levels": ["retailer_id", "ppg_id"],
+        "model_specification": {
+            "dependent_variable": "log_vol",
+            "main_effects": ["log_price"],
+            "fixed_effects": {
+                "interactions": [
+                    {"measure": "log_price", "with_level": "retailer_id"}
+                ]
+            },
+            "random_effects": {
+                "uncorrelated": {"intercepts": ["ppg_id", "retailer_id"]}
+            },
+        },
+        "distributed": {"segment_levels": ["retailer_id"]},
+    }
+
+
+def test_segment_specification_drops_segment_levels():
+    formula = prepare_formula_for_MM(
+        _segment_specification(_segment_params(), ["retailer_id"])
+    )
+    assert formula == "log_vol ~ log_price + (1|ppg_id)"
+
+
+def test_fit_segment_isolates_failure():
+    segment = _panel().query("retailer_id == 'R1'")
+    ok = _fit_segment(segment, ["retailer_id"], "log_vol ~ log_price + (1|ppg_id)")
+    assert list(ok["term"]) == ["Intercept", "log_price"]
+    assert ok["error"].isna().all()
+    assert (ok["retailer_id"] == "R1").all()
+
+    failed = _fit_segment(segment, ["retailer_id"], "log_vol ~ missing_column")
+    assert len(failed) == 1
+    assert "missing_column" in failed["error"].iloc[0]
+
+
+def test_fit_segment_groups_convert_to_segment_schema():
+    pa = pytest.importorskip("pyarrow")
+
+    data = _panel()
+    data.loc[data["retailer_id"] == "R3", "log_vol"] = np.nan
+    # Like applyInPandas, each group is passed with its key columns.
+    result = pd.concat(
+        [
+            _fit_segment(
+                segment,
+                segment_levels=["retailer_id"],
+                formula="log_vol ~ log_price + (1+log_price|ppg_id)",
+            )
+            for _, segment in data.groupby("retailer_id")
+        ],
+        ignore_index=True,
+    )
+
+    arrow_types = {
+        "string": pa.string(),
+        "double": pa.float64(),
+        "bigint": pa.int64(),
+        "boolean": pa.bool_(),
+    }
+    ddl = _segment_schema(["retailer_id"])
+    fields = [field.split(" ") for field in ddl.split(", ")]
+    schema = pa.schema(
+        [(name.strip("`"), arrow_types[dtype]) for name, dtype in fields]
+    )
+    table = pa.Table.from_pandas(result, schema=schema, preserve_index=False)
+    assert table.schema.equals(schema)
+
+    fitted = result[result["error"].isna()]
+    assert set(fitted["retailer_id"]) == {"R1", "R2"}
+    assert fitted["converged"].all()
+    assert fitted["warning"].isna().all()
+    failed = result[result["error"].notna()]
+    assert list(failed["retailer_id"]) == ["R3"]
+    assert failed[["term", "estimate"]].isna().all().all()
+
+
+@pytest.fixture(scope="module")
+def spark():
+    pytest.importorskip("pyspark")
+    from pyspark.sql import SparkSession
+
+    try:
+        session = (
+            SparkSession.builder.master("local[*]")
+            .config("spark.sql.execution.arrow.pyspark.enabled", "true")
+            .getOrCreate()
+        )
+    except Exception as exc:  # noqa: BLE001 - no JVM available
+        pytest.skip(f"Spark unavailable: {exc}")
+    yield session
+    session.stop()
+
+
+def test_distributed_mixed_modeling_node(spark):
+    data = _panel()
+    data.loc[data["retailer_id"] == "R3", "log_vol"] = np.nan
+    result = distributed_mixed_modeling_node(
+        spark.createDataFrame(data), _segment_params()
+    ).toPandas()
+
+    fitted = result[result["error"].isna()]
+    assert set(fitted["retailer_id"]) == {"R1", "R2"}
+    assert set(fitted["term"]) == {"Intercept", "log_price"}
+    assert (fitted["n_obs"] > 0).all()
+    estimates = fitted[fitted["term"] == "log_price"]["estimate"]
+    assert np.allclose(estimates, -2, atol=0.5)
+
+    failed = result[result["error"].notna()]
+    assert list(failed["retailer_id"]) == ["R3"]
+
+
+def test_model_selection_node_rank_direction(monkeypatch):
+    from econometrics_modelling.pipelines.mixed_modelling import nodes
+
+    fits = {
+        "y ~ a": {"aic": 10.0, "log_likelihood": -3.0, "converged": True},
+        "y ~ b": {"aic": 12.0, "log_likelihood": -2.0, "converged": True},
+        "y ~ c": {"aic": 5.0, "log_likelihood": -1.0, "converged": False},
+    }
+
+    def fake_fit(data, formula):
+        return {
+            "bic": 0.0,
+            "fit_time": 0.0,
+            "warning": None,
+            "coefficients": None,
+            **fits[formula],
+        }
+
+    monkeypatch.setattr(nodes, "fit_mixedlm", fake_fit)
+    selection = {
+        "variants": [
+            {"name": name, "formula": f"y ~ {name}"} for name in ["a", "b", "c"]
+        ]
+    }
+    by_aic = model_selection_node(_panel(), {}, selection)
+    assert list(by_aic["spec_name"]) == ["a", "b", "c"]
+
+    by_llf = model_selection_node(
+        _panel(), {}, {**selection, "rank_by": "log_likelihood"}
+    )
+    assert list(by_llf["spec_name"]) == ["b", "a", "c"]
+
+    with pytest.raises(ValueError, match="rank_by"):
+        model_selection_node(_panel(), {}, {**selection, "rank_by": "fit_time"})